@@ -58,6 +58,16 @@ class ConfigLoader:
         """
         return self.config["headers"]
 
+    def get_profiler_config(self) -> Dict[str, Any]:
+        """
+        Retrieves the optional profiler configuration section.
+
+        Returns:
+            Dict[str, Any]: A dictionary containing the profiler settings,
+                            or an empty dictionary if the section is missing.
+        """
+        return self.config.get("profiler") or {}
+
     def get_database_config(self) -> Dict[str, Any]:
         """
         Retrieves the database configuration, merging settings from
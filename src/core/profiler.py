@@ -0,0 +1,430 @@
+#Copyright (C) 2025 MohammadjavadMorady
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+"""
+This module defines the Profiler class, which backs the `--profile` mode
+of the application. It wraps each scraping stage with cProfile, takes
+periodic tracemalloc snapshots, and watches the event loop for blocking
+calls. All reports are written to a timestamped directory under
+'logs/profile', next to the regular log file.
+"""
+import asyncio
+import cProfile
+import io
+import linecache
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+
+DEFAULTS: Dict[str, Any] = {
+    "output_dir": "logs/profile",
+    "snapshot_interval": 30,
+    "top_allocations": 15,
+    "top_functions": 30,
+    "lag_interval": 0.1,
+    "lag_threshold": 0.5,
+    "tracemalloc_frames": 5,
+}
+
+# Stall samples are attributed to the innermost frame inside this tree
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+class Profiler:
+    """
+    Collects per-stage CPU and memory profiles and event loop lag reports.
+
+    When disabled, every method is a no-op so the caller does not need to
+    branch on whether profiling is active.
+
+    Attributes:
+        enabled (bool): Whether profiling is active.
+        report_dir (Optional[str]): Directory the reports are written to.
+    """
+    def __init__(self, enabled: bool = False, settings: Optional[Dict[str, Any]] = None):
+        """
+        Initializes the Profiler.
+
+        Args:
+            enabled (bool, optional): Whether to collect profiles. Defaults to False.
+            settings (Optional[Dict[str, Any]], optional): Overrides for the values
+                in DEFAULTS, usually the 'profiler' section of the config file.
+        """
+        self.enabled = enabled
+        self.settings = {**DEFAULTS, **(settings or {})}
+        self.report_dir: Optional[str] = None
+        self._stage_summaries: List[str] = []
+        self._current_stage = "startup"
+        self._last_beat = 0.0
+        self._writing_reports = False
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_handle: Optional[asyncio.TimerHandle] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._snapshotter: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._write_lock = threading.Lock()
+        self._pauses: List[Tuple[float, float]] = []
+        self._pause_lock = threading.Lock()
+        self._previous_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_lock = threading.Lock()
+
+    async def __aenter__(self) -> "Profiler":
+        """
+        Starts tracemalloc, the event loop heartbeat, the watchdog thread and
+        the periodic snapshot thread.
+
+        Returns:
+            Profiler: This profiler instance.
+        """
+        if not self.enabled:
+            return self
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.report_dir = os.path.join(self.settings["output_dir"], timestamp)
+        os.makedirs(self.report_dir, exist_ok=True)
+
+        tracemalloc.start(self.settings["tracemalloc_frames"])
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop_event.clear()
+        self._heartbeat(asyncio.get_running_loop())
+        self._watchdog = threading.Thread(target=self._watch, name="profiler-watchdog", daemon=True)
+        self._watchdog.start()
+        self._snapshotter = threading.Thread(
+            target=self._take_periodic_snapshots, name="profiler-snapshots", daemon=True
+        )
+        self._snapshotter.start()
+
+        logger.info(f"Profiling enabled, writing reports to {self.report_dir}")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        """
+        Stops the background monitors and writes the final memory snapshot
+        and the summary report.
+        """
+        if not self.enabled:
+            return
+
+        self._stop_event.set()
+        if self._heartbeat_handle:
+            self._heartbeat_handle.cancel()
+        for thread in (self._watchdog, self._snapshotter):
+            if thread:
+                thread.join()
+
+        self._write_snapshot("final")
+        tracemalloc.stop()
+
+        self._append("summary.txt", "\n".join(self._stage_summaries) + "\n")
+        logger.info(f"Profiling reports saved to {self.report_dir}")
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Profiles a single stage of the pipeline with cProfile and records its
+        wall time, CPU time and memory usage. CPU time is measured on the event
+        loop thread only, where all scraper code runs, so the profiler's own
+        background threads are not counted.
+
+        The cProfile statistics are saved to '<name>.prof' (loadable with
+        pstats or snakeviz) and '<name>_cpu.txt' in the report directory.
+
+        Args:
+            name (str): The stage name, used for report file names.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        self._current_stage = name
+        tracemalloc.reset_peak()
+        mem_before, _ = tracemalloc.get_traced_memory()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._writing_reports = True
+            reports_start = time.perf_counter()
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            mem_after, mem_peak = tracemalloc.get_traced_memory()
+
+            profile.dump_stats(os.path.join(self.report_dir, f"{name}.prof"))
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.settings["top_functions"])
+            self._append(f"{name}_cpu.txt", stream.getvalue())
+            self._write_snapshot(f"end of {name}")
+
+            summary = (
+                f"{name}: wall={wall:.2f}s cpu={cpu:.2f}s "
+                f"mem_delta={(mem_after - mem_before) / 1024 ** 2:.2f}MiB "
+                f"mem_peak={mem_peak / 1024 ** 2:.2f}MiB"
+            )
+            self._stage_summaries.append(summary)
+            logger.info(f"Profile {summary}")
+            self._current_stage = "idle"
+            self._add_pause(reports_start, time.perf_counter())
+            self._writing_reports = False
+
+    def _heartbeat(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Records when the event loop last ran and schedules itself again, so
+        the watchdog can tell when the loop is blocked.
+
+        A plain timer callback runs in the same loop iteration its timer fires
+        in, unlike a task waiting on asyncio.sleep, so short blocking calls
+        separated by awaits are not merged into one stall.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The running event loop.
+        """
+        self._last_beat = time.perf_counter()
+        self._heartbeat_handle = loop.call_later(
+            self.settings["lag_interval"], self._heartbeat, loop
+        )
+
+    def _watch(self) -> None:
+        """
+        Runs in a background thread. Follows each event loop stall until the
+        loop recovers and samples the loop thread's stack on every tick.
+
+        Time spent on the profiler's own work (end-of-stage reports on the
+        loop thread and periodic snapshots) is left out of stall lengths, so
+        it is not reported as a stall or blamed on application code.
+        """
+        interval = self.settings["lag_interval"]
+        threshold = self.settings["lag_threshold"]
+        stall_beat: Optional[float] = None
+        stall_stage = self._current_stage
+        samples: Dict[str, float] = {}
+        stacks: Dict[str, str] = {}
+        previous_tick = time.perf_counter()
+
+        while not self._stop_event.wait(interval):
+            now = time.perf_counter()
+            elapsed = now - previous_tick
+            previous_tick = now
+            last_beat = self._last_beat
+
+            if stall_beat is not None and last_beat != stall_beat:
+                self._close_stall(stall_stage, stall_beat, last_beat, samples, stacks)
+                stall_beat = None
+
+            if stall_beat is None and not self._writing_reports:
+                lag = now - last_beat - interval - self._paused_time(last_beat, now)
+                if lag > threshold:
+                    stall_beat = last_beat
+                    stall_stage = self._current_stage
+                    samples, stacks = {}, {}
+
+            if stall_beat is not None and not self._writing_reports:
+                location, stack = self._sample_loop_thread(stacks)
+                samples[location] = samples.get(location, 0.0) + elapsed
+                stacks.setdefault(location, stack)
+
+            self._prune_pauses(stall_beat if stall_beat is not None else last_beat)
+
+        if stall_beat is not None:
+            self._close_stall(stall_stage, stall_beat, time.perf_counter(), samples, stacks)
+
+    def _take_periodic_snapshots(self) -> None:
+        """
+        Runs in a background thread, separate from the lag watchdog so that
+        stall sampling keeps going while a snapshot is being taken.
+        """
+        while not self._stop_event.wait(self.settings["snapshot_interval"]):
+            start = time.perf_counter()
+            try:
+                self._write_snapshot("periodic")
+            finally:
+                self._add_pause(start, time.perf_counter())
+
+    def _sample_loop_thread(self, stacks: Dict[str, str]) -> Tuple[str, str]:
+        """
+        Finds where the loop thread currently is.
+
+        The location is the innermost frame inside the application source tree,
+        so time spent deep inside a library (e.g. the sockets under requests.get)
+        is attributed to the application line that made the call.
+
+        Args:
+            stacks (Dict[str, str]): Stacks already recorded for this stall;
+                a stack is only formatted for locations not seen before.
+
+        Returns:
+            Tuple[str, str]: The location and the formatted stack of the loop thread.
+        """
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return "<stack unavailable>", ""
+
+        location_frame = frame
+        filename = frame.f_code.co_filename
+        current = frame
+        while current is not None:
+            path = os.path.abspath(current.f_code.co_filename)
+            if path.startswith(APP_DIR) and path != os.path.abspath(__file__):
+                location_frame = current
+                filename = os.path.relpath(path, APP_DIR)
+                break
+            current = current.f_back
+
+        code = location_frame.f_code
+        location = f"{filename}:{location_frame.f_lineno} in {code.co_name}"
+        stack = "" if location in stacks else "".join(traceback.format_stack(frame))
+        return location, stack
+
+    def _close_stall(
+        self, stage: str, stall_beat: float, recovered_beat: float,
+        samples: Dict[str, float], stacks: Dict[str, str],
+    ) -> None:
+        """
+        Logs a finished event loop stall and writes its sampled locations and
+        the stack of the location that took most of the time to
+        'event_loop_lag.txt'.
+
+        Args:
+            stage (str): The stage that was running when the stall started.
+            stall_beat (float): The last heartbeat before the stall.
+            recovered_beat (float): The first heartbeat after the stall.
+            samples (Dict[str, float]): Time spent at each sampled location.
+            stacks (Dict[str, str]): A formatted stack for each sampled location.
+        """
+        interval = self.settings["lag_interval"]
+        duration = (
+            recovered_beat - stall_beat - interval
+            - self._paused_time(stall_beat, recovered_beat)
+        )
+        if duration <= self.settings["lag_threshold"] or not samples:
+            return
+
+        ranked = sorted(samples.items(), key=lambda item: item[1], reverse=True)
+        sampled = sum(samples.values())
+        top_location = ranked[0][0]
+
+        logger.warning(
+            f"Event loop was blocked for {duration:.2f}s during stage "
+            f"'{stage}', mostly at {top_location}"
+        )
+        lines = [
+            f"[{datetime.now().isoformat()}] stage={stage} blocked={duration:.2f}s"
+        ]
+        for location, seconds in ranked:
+            lines.append(f"  {seconds:8.2f}s {seconds / sampled:6.1%}  {location}")
+        lines.append(f"Stack at {top_location}:")
+        lines.append(stacks.get(top_location) or "<stack unavailable>\n")
+        self._append("event_loop_lag.txt", "\n".join(lines) + "\n")
+
+    def _add_pause(self, start: float, end: float) -> None:
+        """
+        Records a window of profiler work that must not count towards stalls.
+
+        Args:
+            start (float): Start of the window, from time.perf_counter().
+            end (float): End of the window, from time.perf_counter().
+        """
+        with self._pause_lock:
+            self._pauses.append((start, end))
+
+    def _paused_time(self, start: float, end: float) -> float:
+        """
+        Returns how much of the given interval was spent on profiler work.
+
+        Args:
+            start (float): Start of the interval, from time.perf_counter().
+            end (float): End of the interval, from time.perf_counter().
+
+        Returns:
+            float: The overlap with the recorded pause windows, in seconds.
+        """
+        with self._pause_lock:
+            return sum(
+                max(0.0, min(end, pause_end) - max(start, pause_start))
+                for pause_start, pause_end in self._pauses
+            )
+
+    def _prune_pauses(self, before: float) -> None:
+        """
+        Drops pause windows that ended before the given time.
+
+        Args:
+            before (float): Windows ending before this time are no longer needed.
+        """
+        with self._pause_lock:
+            self._pauses = [pause for pause in self._pauses if pause[1] >= before]
+
+    def _write_snapshot(self, label: str) -> None:
+        """
+        Takes a tracemalloc snapshot and appends the top allocation sites, and
+        the sites that grew the most since the previous snapshot, to 'memory.txt'.
+
+        Args:
+            label (str): A short description of when the snapshot was taken.
+        """
+        with self._snapshot_lock:
+            if not tracemalloc.is_tracing():
+                return
+            self._write_snapshot_locked(label)
+
+    def _write_snapshot_locked(self, label: str) -> None:
+        """
+        Does the work of _write_snapshot. The caller must hold _snapshot_lock,
+        since snapshots are taken from both the loop thread and the snapshot thread.
+
+        Args:
+            label (str): A short description of when the snapshot was taken.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, traceback.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        top_allocations = self.settings["top_allocations"]
+
+        lines = [
+            f"[{datetime.now().isoformat()}] {label} stage={self._current_stage} "
+            f"current={current / 1024 ** 2:.2f}MiB peak={peak / 1024 ** 2:.2f}MiB",
+            "Top allocation sites:",
+        ]
+        for stat in snapshot.statistics("lineno")[:top_allocations]:
+            lines.append(f"  {stat}")
+        if self._previous_snapshot is not None:
+            lines.append("Growth since previous snapshot:")
+            for stat in snapshot.compare_to(self._previous_snapshot, "lineno")[:top_allocations]:
+                lines.append(f"  {stat}")
+        self._previous_snapshot = snapshot
+        self._append("memory.txt", "\n".join(lines) + "\n\n")
+
+    def _append(self, filename: str, content: str) -> None:
+        """
+        Appends content to a report file, guarding against concurrent writes
+        from the watchdog thread.
+
+        Args:
+            filename (str): The report file name inside the report directory.
+            content (str): The text to append.
+        """
+        with self._write_lock:
+            with open(os.path.join(self.report_dir, filename), "a", encoding="utf-8") as f:
+                f.write(content)
@@ -13,15 +13,17 @@ It orchestrates the process of scraping product links from Digikala,
 extracting product specifications from those links, and then saving
 the collected data using a configured storage backend.
 """
+import argparse
 import asyncio
 from core.config_loader import ConfigLoader
 from core.logger import setup_logger
+from core.profiler import Profiler
 from scrapers.link_scraper import DigikalaLinkScraper
 from scrapers.specs_scraper import DigikalaSpecsScraper
 from storage.storage_factory import StorageFactory
 from loguru import logger
 
-async def main():
+async def main(profile: bool = False):
     """
     The main asynchronous function that orchestrates the scraping process.
 
@@ -32,33 +34,48 @@ async def main():
     4. Scrapes product specifications using DigikalaSpecsScraper.
     5. Saves the scraped data using a storage backend from StorageFactory.
     6. Closes the storage connection if it has a 'close' method (e.g., for databases).
+
+    Args:
+        profile (bool, optional): If True, each stage is profiled and the
+            reports are written under 'logs/profile'. Defaults to False.
     """
     setup_logger()
     config_loader = ConfigLoader()
 
-    # Step 1: Scrape links
-    logger.info("Starting link scraping...")
-    link_scraper = DigikalaLinkScraper(config_loader)
-    urls = link_scraper.scrape_links()
-    logger.info(f"Found {len(urls)} product links.")
+    async with Profiler(profile, config_loader.get_profiler_config()) as profiler:
+        # Step 1: Scrape links
+        logger.info("Starting link scraping...")
+        with profiler.stage("link_scraping"):
+            link_scraper = DigikalaLinkScraper(config_loader)
+            urls = link_scraper.scrape_links()
+        logger.info(f"Found {len(urls)} product links.")
 
-    # Step 2: Scrape specs
-    logger.info("Starting specifications scraping...")
-    specs_scraper = DigikalaSpecsScraper(config_loader)
-    data = await specs_scraper.scrape_specs(list(urls))
-    logger.info(f"Scraped specifications for {len(data)} products.")
+        # Step 2: Scrape specs
+        logger.info("Starting specifications scraping...")
+        with profiler.stage("specs_scraping"):
+            specs_scraper = DigikalaSpecsScraper(config_loader)
+            data = await specs_scraper.scrape_specs(list(urls))
+        logger.info(f"Scraped specifications for {len(data)} products.")
 
-    # Step 3: Save data
-    logger.info("Starting data saving...")
-    storage = StorageFactory.get_storage(config_loader)
-    await storage.save(data)
-    logger.info("Data saving complete.")
+        # Step 3: Save data
+        logger.info("Starting data saving...")
+        with profiler.stage("storage"):
+            storage = StorageFactory.get_storage(config_loader)
+            await storage.save(data)
+            logger.info("Data saving complete.")
 
-    # Close database connection if using Postgres
-    if hasattr(storage, "close"):
-        logger.info("Closing storage connection.")
-        await storage.close()
-        logger.info("Storage connection closed.")
+            # Close database connection if using Postgres
+            if hasattr(storage, "close"):
+                logger.info("Closing storage connection.")
+                await storage.close()
+                logger.info("Storage connection closed.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Scrape product data from Digikala.")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile each stage and write CPU, memory and event loop lag reports to logs/profile",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(profile=args.profile))
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import time
+
+from core.profiler import Profiler
+
+SETTINGS = {
+    "snapshot_interval": 30,
+    "lag_interval": 0.05,
+    "lag_threshold": 0.3,
+}
+
+
+def _block(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def _run(profiler: Profiler, stage_body) -> None:
+    async def run():
+        async with profiler:
+            with profiler.stage("work"):
+                await stage_body()
+
+    asyncio.run(run())
+
+
+def test_disabled_profiler_is_noop(tmp_path):
+    output_dir = tmp_path / "profile"
+    profiler = Profiler(False, {**SETTINGS, "output_dir": str(output_dir)})
+
+    async def body():
+        _block(0.01)
+
+    _run(profiler, body)
+
+    assert profiler.report_dir is None
+    assert not output_dir.exists()
+
+
+def test_stage_writes_reports(tmp_path):
+    profiler = Profiler(True, {**SETTINGS, "output_dir": str(tmp_path)})
+
+    async def body():
+        await asyncio.sleep(0.05)
+
+    _run(profiler, body)
+
+    files = set(os.listdir(profiler.report_dir))
+    assert {"work.prof", "work_cpu.txt", "memory.txt", "summary.txt"} <= files
+    with open(os.path.join(profiler.report_dir, "summary.txt"), encoding="utf-8") as f:
+        assert f.read().startswith("work: wall=")
+
+
+def test_blocking_call_is_reported(tmp_path):
+    profiler = Profiler(True, {**SETTINGS, "output_dir": str(tmp_path)})
+
+    async def body():
+        _block(1.0)
+
+    _run(profiler, body)
+
+    with open(os.path.join(profiler.report_dir, "event_loop_lag.txt"), encoding="utf-8") as f:
+        report = f.read()
+    sleep_line = _block.__code__.co_firstlineno + 1
+    assert "stage=work blocked=" in report
+    assert f"test_profiler.py:{sleep_line} in _block" in report
+
+
+def test_short_blocks_are_not_reported(tmp_path):
+    profiler = Profiler(True, {**SETTINGS, "output_dir": str(tmp_path)})
+
+    async def body():
+        for _ in range(6):
+            _block(0.15)
+            await asyncio.sleep(0)
+
+    _run(profiler, body)
+
+    assert not os.path.exists(os.path.join(profiler.report_dir, "event_loop_lag.txt"))